@@ -1,5 +1,8 @@
 import os
+import shutil
+import subprocess
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, request, jsonify, render_template, send_file
 import librosa
 import numpy as np
@@ -9,35 +12,60 @@ import uuid
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100 MB limit
 
-# Temporary storage for uploaded files (in memory)
-UPLOAD_FOLDER = tempfile.mkdtemp()
+# Temporary storage for uploaded files (in memory: tmpfs when available)
+UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or tempfile.mkdtemp(
+    dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 ALLOWED_EXTENSIONS = {'wav', 'mp3', 'm4a', 'flac', 'aac'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def compute_offset(reference_path, test_path, sr=22050, hop_length=512, threshold_ms=50):
+def load_audio(path, sr=22050):
     """
-    Returns offset in ms and a boolean indicating if manual review is needed.
-    Positive offset means test is delayed relative to reference.
+    Decodes an audio file to mono float32 at the given sample rate.
+    ffmpeg downmixes and resamples in C, so no Python-side resampling is needed.
+    """
+    cmd = [
+        'ffmpeg', '-nostdin', '-v', 'error', '-i', path,
+        '-ac', '1', '-ar', str(sr), '-f', 'f32le', '-'
+    ]
+    result = subprocess.run(cmd, capture_output=True, check=True)
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+def rms_envelope(path, sr=22050, hop_length=512):
+    """
+    Loads an audio file and returns its normalized RMS energy envelope.
     """
-    ref, _ = librosa.load(reference_path, sr=sr, mono=True)
-    test, _ = librosa.load(test_path, sr=sr, mono=True)
+    y = load_audio(path, sr=sr)
 
     # Trim leading/trailing silence to avoid false offsets from different padding
-    ref, _ = librosa.effects.trim(ref)
-    test, _ = librosa.effects.trim(test)
+    y, _ = librosa.effects.trim(y)
 
-    # Compute RMS energy envelope
-    ref_rms = librosa.feature.rms(y=ref, hop_length=hop_length)[0]
-    test_rms = librosa.feature.rms(y=test, hop_length=hop_length)[0]
+    # Compute RMS energy envelope over non-overlapping hop-sized frames
+    # (zero-pad the tail so it forms a final partial frame)
+    y = np.pad(y, (0, -len(y) % hop_length))
+    frames = y.reshape(-1, hop_length)
+    rms = np.sqrt(np.mean(frames ** 2, axis=1))
 
-    # Normalize RMS to [0,1] to reduce amplitude influence
-    ref_rms = (ref_rms - ref_rms.min()) / (ref_rms.max() - ref_rms.min() + 1e-10)
-    test_rms = (test_rms - test_rms.min()) / (test_rms.max() - test_rms.min() + 1e-10)
+    # Normalize RMS to [0,1] in place to reduce amplitude influence
+    rms -= rms.min()
+    rms /= rms.max() + 1e-10
+    return rms
+
+def compute_offset(reference_path, test_path, sr=22050, hop_length=512, threshold_ms=50,
+                   ref_rms=None):
+    """
+    Returns offset in ms and a boolean indicating if manual review is needed.
+    Positive offset means test is delayed relative to reference.
+    Pass a precomputed ref_rms to skip decoding the reference again.
+    """
+    if ref_rms is None:
+        ref_rms = rms_envelope(reference_path, sr=sr, hop_length=hop_length)
+    test_rms = rms_envelope(test_path, sr=sr, hop_length=hop_length)
 
-    # Cross-correlate
-    correlation = signal.correlate(test_rms, ref_rms, mode='same')
+    # Cross-correlate (FFT is O(N log N); direct mode is O(N^2) on long clips)
+    correlation = signal.correlate(test_rms, ref_rms, mode='same', method='fft')
     lag = np.argmax(correlation) - len(ref_rms)//2
     offset_ms = lag * hop_length / sr * 1000
 
@@ -58,32 +86,44 @@ def upload_files():
     if len(files) < 2:
         return jsonify({'error': 'Please upload at least two files'}), 400
 
-    # Save uploaded files with unique names to avoid collisions
-    saved_paths = []
     for file in files:
-        if file and allowed_file(file.filename):
+        if not (file and allowed_file(file.filename)):
+            return jsonify({'error': f'File type not allowed: {file.filename}'}), 400
+
+    # Save uploaded files into a per-request directory so concurrent requests
+    # never collide and cleanup is a single rmtree
+    req_dir = os.path.join(UPLOAD_FOLDER, uuid.uuid4().hex)
+    os.makedirs(req_dir)
+    try:
+        saved_paths = []
+        for i, file in enumerate(files):
             ext = file.filename.rsplit('.', 1)[1].lower()
-            unique_name = f"{uuid.uuid4().hex}.{ext}"
-            save_path = os.path.join(UPLOAD_FOLDER, unique_name)
+            save_path = os.path.join(req_dir, f"{i:03d}.{ext}")
             file.save(save_path)
             saved_paths.append((file.filename, save_path))
-        else:
-            return jsonify({'error': f'File type not allowed: {file.filename}'}), 400
-
-    # Use the first file as reference
-    ref_filename, ref_path = saved_paths[0]
-    results = []
-
-    for filename, path in saved_paths[1:]:
-        offset_ms, needs_review = compute_offset(ref_path, path)
-        results.append({
-            'filename': filename,
-            'offset_ms': offset_ms,
-            'needs_review': needs_review
-        })
 
-    # Clean up temporary files (optional – you can keep them for download)
-    # We'll keep them for now; you may add a cleanup later.
+        # Use the first file as reference
+        ref_filename, ref_path = saved_paths[0]
+        results = []
+
+        # Decode the reference once and share its envelope across all comparisons
+        ref_rms = rms_envelope(ref_path)
+
+        # Each comparison is independent; run them concurrently (decode and NumPy
+        # kernels release the GIL). map() keeps results in upload order.
+        test_files = saved_paths[1:]
+        workers = max(1, min(len(test_files), os.cpu_count() or 1))
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            offsets = ex.map(lambda item: compute_offset(ref_path, item[1], ref_rms=ref_rms), test_files)
+            for (filename, _), (offset_ms, needs_review) in zip(test_files, offsets):
+                results.append({
+                    'filename': filename,
+                    'offset_ms': offset_ms,
+                    'needs_review': needs_review
+                })
+    finally:
+        # Clean up temporary files
+        shutil.rmtree(req_dir, ignore_errors=True)
 
     return jsonify({
         'reference': ref_filename,